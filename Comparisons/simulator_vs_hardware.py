@@ -3,11 +3,13 @@
 
 # Optimization modeling
 from qiskit_optimization import QuadraticProgram
-from qiskit_optimization.algorithms import MinimumEigenOptimizer
+from qiskit_optimization.algorithms import (
+    MinimumEigenOptimizer, OptimizationResult, OptimizationResultStatus
+)
 
 # QAOA & optimizer
 from qiskit_algorithms import QAOA
-from qiskit_algorithms.optimizers import COBYLA
+from qiskit_algorithms.optimizers import COBYLA, SPSA
 
 # Sampler primitives - V1 removed from IBM Runtime, use compatibility approach
 from qiskit_aer.primitives import Sampler as AERSampler
@@ -18,11 +20,53 @@ from qiskit_ibm_runtime import SamplerV2 as IBMSamplerV2
 
 # Numerical & stock data libraries
 import numpy as np
+from scipy import sparse
 import yfinance as yf
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
+import hashlib
+import pathlib
 import time
 
+# JIT compilation for the numeric QUBO/Hamiltonian kernels
+from numba import njit
+
+
+@njit(cache=True, fastmath=True)
+def _build_qubo_numba(mu, sigma, risk_aversion, penalty_strength, B):
+    """Fill the QUBO matrix from a flat mu vector and the covariance matrix"""
+    n = sigma.shape[0]
+    qubo_matrix = np.empty((n, n), dtype=sigma.dtype)
+    
+    for i in range(n):
+        # Diagonal terms: individual asset risk and return, plus penalty
+        qubo_matrix[i, i] = risk_aversion * sigma[i, i] - mu[i] + penalty_strength * (1 - 2 * B)
+        
+        # Off-diagonal terms: covariance and penalty
+        for j in range(i + 1, n):
+            value = risk_aversion * sigma[i, j] + 2 * penalty_strength
+            qubo_matrix[i, j] = value
+            qubo_matrix[j, i] = value
+    
+    return qubo_matrix
+
+
+# On-disk cache for downloaded prices and their derived statistics
+CACHE_DIR = pathlib.Path.home() / ".cache" / "qfolio"
+
+
+def _cache_path(tickers, days, interval, start, end_date):
+    """Cache file for a price request, or None while the window still reaches past today"""
+    # Same key scheme as Small-Scale Implementation/qaoa_mag7.py, so both scripts share entries
+    if pd.Timestamp(end_date) > pd.Timestamp.today().normalize():
+        return None  # Later bars are still to come, so the download is not final
+    cache_key = repr((tuple(sorted(tickers)), days, interval, start, end_date))
+    return CACHE_DIR / f"{hashlib.md5(cache_key.encode()).hexdigest()}.parquet"
+
+
+# QUBO entries below this magnitude are treated as zero
+QUBO_TOLERANCE = 1e-12
+
 
 class Magnificent_7:
     def __init__(self, B, days, interval, start):
@@ -42,10 +86,15 @@ class Magnificent_7:
         # Validate downloaded data
         self.validate_data()
 
-        # Compute statistics FIRST
-        returns_matrix = self.compute_returns()
-        self.mu = self.compute_mu(returns_matrix)
-        self.sigma = self.covariance_matrix(returns_matrix)
+        # Compute statistics FIRST (reused from the cache alongside cached prices)
+        cached_stats = self.load_cached_statistics()
+        if cached_stats is not None:
+            self.mu, self.sigma = cached_stats
+        else:
+            returns_matrix = self.compute_returns()
+            self.mu = self.compute_mu(returns_matrix)
+            self.sigma = self.covariance_matrix(returns_matrix)
+            self.save_cached_statistics()
 
         # Parameters for QUBO formulation
         self.risk_aversion = 1.0  # Risk aversion parameter (q)
@@ -56,35 +105,40 @@ class Magnificent_7:
         self.backend = None
         self.setup_ibm_hardware()
 
+        # QUBO variable -> classical bit map for sampled bitstrings. Measurements are added
+        # before transpiling, so classical bit k holds qubit k, which carries variable n - 1 - k.
+        self._variable_to_clbit = self.n - 1 - np.arange(self.n)
+
         # Build QUBO matrix and program
         self.qubo_matrix = self.build_qubo_matrix(
             self.mu, self.sigma, self.risk_aversion, self.penalty_strength, self.B
         )
         self.program = self.build_quadratic_program(self.qubo_matrix)
 
+        # Sparse copy of the QUBO for the Hamiltonian conversion on the hardware path
+        self.qubo_sparse = sparse.csr_matrix(self.qubo_matrix)
+
     def validate_data(self):
         """Validate downloaded stock data"""
         if self.data.empty:
             raise ValueError("No stock data downloaded")
         
-        # Check if all tickers have data
-        missing_tickers = []
-        for ticker in self.tickers:
-            if ticker not in self.data.columns:
-                missing_tickers.append(ticker)
+        # Check if all tickers have data (order-preserving set difference)
+        missing_tickers = pd.Index(self.tickers).difference(self.data.columns, sort=False).tolist()
         
         if missing_tickers:
             print(f"Warning: Missing data for tickers: {missing_tickers}")
             # Handle missing tickers more explicitly
-            available_tickers = [t for t in self.tickers if t in self.data.columns]
-            if len(available_tickers) < self.B:
-                raise ValueError(f"Not enough stocks available ({len(available_tickers)}) for budget {self.B}")
-            print(f"Continuing with {len(available_tickers)} available stocks")
+            available_tickers = len(self.tickers) - len(missing_tickers)
+            if available_tickers < self.B:
+                raise ValueError(f"Not enough stocks available ({available_tickers}) for budget {self.B}")
+            print(f"Continuing with {available_tickers} available stocks")
         
-        # Check for any columns with all NaN values
-        nan_columns = self.data.columns[self.data.isnull().all()].tolist()
-        if nan_columns:
-            raise ValueError(f"No data available for: {nan_columns}")
+        # Check for any columns with all NaN values (skipped when there are no NaNs at all)
+        if self.data.isnull().values.any():
+            nan_columns = self.data.columns[self.data.isnull().all()].tolist()
+            if nan_columns:
+                raise ValueError(f"No data available for: {nan_columns}")
         
         print(f"Data validation passed: {len(self.data.columns)} stocks, {len(self.data)} days")
 
@@ -95,17 +149,19 @@ class Magnificent_7:
             self.service = QiskitRuntimeService()
             
             # Select backend that can handle our problem size
-            suitable_backends = self.service.backends(
-                filters=lambda b: (
-                    b.num_qubits >= self.n and 
-                    b.status().operational and 
-                    not b.configuration().simulator
-                )
-            )
+            # (status() is a network call, so query it once per backend)
+            suitable_backends = []
+            for b in self.service.backends():
+                if b.num_qubits < self.n or b.configuration().simulator:
+                    continue
+                status = b.status()
+                if status.operational:
+                    suitable_backends.append((b, status))
+            
             if suitable_backends:
-                self.backend = min(suitable_backends, key=lambda b: b.status().pending_jobs)
+                self.backend, status = min(suitable_backends, key=lambda t: t[1].pending_jobs)
                 print(f"Selected hardware: {self.backend.name} ({self.backend.num_qubits} qubits)")
-                print(f"Current queue: {self.backend.status().pending_jobs} jobs")
+                print(f"Current queue: {status.pending_jobs} jobs")
             else:
                 print("No suitable quantum hardware found. Hardware comparison will be skipped.")
                 self.backend = None
@@ -117,15 +173,18 @@ class Magnificent_7:
             self.backend = None
     
     def download_data(self, days, interval, start):
-        # Convert start date string to datetime object
-        start_date = datetime.strptime(start, '%Y-%m-%d')
-        
-        # Calculate end date by adding the specified number of days
-        # Add extra days to account for weekends and holidays
-        # Typically need about 1.4x calendar days to get the desired trading days
-        calendar_days_needed = int(days * 1.4) + 7  # Add buffer for weekends/holidays
-        end_date = start_date + timedelta(days=calendar_days_needed)
-        end_date_str = end_date.strftime('%Y-%m-%d')
+        # Calculate end date as the requested number of business days after start
+        # (+2 covers the exclusive end date and an occasional holiday)
+        start_date = pd.Timestamp(start)
+        end_date_str = (start_date + pd.tseries.offsets.BDay(days + 2)).strftime('%Y-%m-%d')
+        
+        # Reuse a previous download of the same request when available
+        self.cache_path = _cache_path(self.tickers, days, interval, start, end_date_str)
+        self.from_cache = self.cache_path is not None and self.cache_path.exists()
+        if self.from_cache:
+            data = pd.read_parquet(self.cache_path)
+            print(f"Loaded {len(data)} trading days of cached data from {start} to {end_date_str}")
+            return data
         
         print(f"Downloading data from {start} to {end_date_str} (to get ~{days} trading days)")
         
@@ -142,7 +201,7 @@ class Magnificent_7:
         except Exception as e:
             raise ValueError(f"Failed to download data: {e}")
                 
-        # Limit to the requested number of days
+        # Safety net: limit to the requested number of days
         if len(data) > days:
             data = data.tail(days)  # Take the most recent 'days' trading days
         
@@ -152,17 +211,44 @@ class Magnificent_7:
         actual_days = len(data)
         print(f"Successfully downloaded {actual_days} trading days of data")
         
+        if self.cache_path is not None:
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            data.to_parquet(self.cache_path)
+        
         return data
+
+    def load_cached_statistics(self):
+        """Load mu and sigma stored next to the cached prices, if the prices came from the cache"""
+        if not self.from_cache:
+            return None
+        mu_path = self.cache_path.with_name(self.cache_path.stem + "_mu.npy")
+        sigma_path = self.cache_path.with_name(self.cache_path.stem + "_sigma.npy")
+        if not (mu_path.exists() and sigma_path.exists()):
+            return None
+        return (np.load(mu_path).astype(np.float32, copy=False),
+                np.load(sigma_path).astype(np.float32, copy=False))
+
+    def save_cached_statistics(self):
+        """Store mu and sigma next to the cached prices"""
+        if self.cache_path is None:
+            return
+        np.save(self.cache_path.with_name(self.cache_path.stem + "_mu.npy"), self.mu)
+        np.save(self.cache_path.with_name(self.cache_path.stem + "_sigma.npy"), self.sigma)
             
     def compute_returns(self):
         """Compute daily returns matrix"""
-        returns_df = self.data.pct_change().dropna()
+        prices = self.data.to_numpy(dtype=np.float64)
         
-        # Check if we have enough data after dropping NaN
-        if len(returns_df) < 2:
+        # Drop days with a missing price for any ticker (holidays, misaligned rows)
+        prices = prices[np.isfinite(prices).all(axis=1)]
+        
+        # Simple returns in one pass: p_t / p_{t-1} - 1
+        returns_matrix = prices[1:] / prices[:-1] - 1.0
+        
+        # Check if we have enough data for return calculation
+        if len(returns_matrix) < 2:
             raise ValueError("Insufficient data for return calculation")
             
-        returns_matrix = returns_df.to_numpy()
         return returns_matrix
     
     def compute_mu(self, returns_matrix):
@@ -173,17 +259,20 @@ class Magnificent_7:
         if np.any(np.isnan(mu)):
             raise ValueError("NaN values found in expected returns")
             
-        return mu
+        # Stored in single precision: far below the shot-noise resolution of QAOA
+        return mu.astype(np.float32, copy=False)
 
     def covariance_matrix(self, returns_matrix):
         """Compute covariance matrix of returns"""
-        sigma = np.cov(returns_matrix.T)
+        # Centered Gram matrix: the matmul runs on multi-threaded BLAS
+        centered = returns_matrix - returns_matrix.mean(axis=0, keepdims=True)
+        sigma = (centered.T @ centered) / (centered.shape[0] - 1)
         
         # Check for any NaN values in covariance matrix
         if np.any(np.isnan(sigma)):
             raise ValueError("NaN values found in covariance matrix")
             
-        return sigma
+        return sigma.astype(np.float32, copy=False)
 
     def build_qubo_matrix(self, mu, sigma, risk_aversion, penalty_strength, B):
         """
@@ -195,23 +284,14 @@ class Magnificent_7:
         Q_ij = risk_aversion * sigma_ij + 2 * penalty  [Off Diagonal Entries]
         """
         
-        # Initialize QUBO matrix
-        qubo_matrix = np.zeros((self.n, self.n))
-        
-        # Diagonal terms: individual asset risk and return, plus penalty
-        for i in range(self.n):
-            qubo_matrix[i, i] = (risk_aversion * sigma[i, i] - mu[i, 0] 
-                               + penalty_strength * (1 - 2 * B))
-        
-        # Off-diagonal terms: covariance and penalty
-        for i in range(self.n):
-            for j in range(i + 1, self.n):
-                covariance_term = risk_aversion * sigma[i, j]
-                penalty_term = 2 * penalty_strength
-                
-                qubo_matrix[i, j] = covariance_term + penalty_term
-                qubo_matrix[j, i] = covariance_term + penalty_term  # Symmetric
+        qubo_matrix = _build_qubo_numba(
+            np.ascontiguousarray(mu.ravel(), dtype=np.float32),
+            np.ascontiguousarray(sigma, dtype=np.float32),
+            float(risk_aversion), float(penalty_strength), int(B)
+        )
         
+        # Drop negligible couplings so the sparse form only keeps real terms
+        qubo_matrix[np.abs(qubo_matrix) < QUBO_TOLERANCE] = 0
         return qubo_matrix
 
     def build_quadratic_program(self, qubo):
@@ -223,18 +303,14 @@ class Magnificent_7:
             program.binary_var(name=f"x{i}")
 
         # Build objective function from QUBO matrix
-        linear = {}
-        quadratic = {}
-
         # Linear terms (diagonal of QUBO)
-        for i in range(self.n):
-            linear[i] = qubo[i, i]
+        linear = dict(enumerate(np.diag(qubo).tolist()))
 
-        # Quadratic terms (off-diagonal of QUBO)
-        for i in range(self.n):
-            for j in range(i + 1, self.n):
-                if qubo[i, j] != 0:
-                    quadratic[(i, j)] = qubo[i, j]
+        # Quadratic terms (nonzero strict upper triangle of QUBO)
+        i_idx, j_idx = np.nonzero(np.triu(qubo, k=1))
+        quadratic = {
+            (i, j): float(qubo[i, j]) for i, j in zip(i_idx.tolist(), j_idx.tolist())
+        }
 
         program.minimize(linear=linear, quadratic=quadratic)
         
@@ -293,24 +369,28 @@ class Magnificent_7:
             from qiskit.quantum_info import SparsePauliOp
             from qiskit_ibm_runtime import Session, EstimatorV2 as Estimator
             from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
-            from scipy.optimize import minimize
             import numpy as np
             
             # Step 1: Convert QUBO matrix to Pauli operator (Hamiltonian)
-            hamiltonian = self._qubo_to_pauli_operator(self.qubo_matrix)
+            hamiltonian = self._qubo_to_pauli_operator(self.qubo_sparse)
             print(f"Created Hamiltonian with {len(hamiltonian)} terms")
             
             # Step 2: Create QAOA ansatz
             qaoa_circuit = QAOAAnsatz(hamiltonian, reps=reps)
             print(f"Created QAOA circuit with {qaoa_circuit.num_qubits} qubits and {reps} layers")
             
-            # Step 3: Transpile for hardware
+            # Measured copy for the final sampling; measurements are added before
+            # transpiling so the sampler only needs parameters bound
+            measured_circuit = qaoa_circuit.measure_all(inplace=False)
+            
+            # Step 3: Transpile for hardware (once per primitive)
             pm = generate_preset_pass_manager(backend=self.backend, optimization_level=1)
             isa_circuit = pm.run(qaoa_circuit)
+            isa_sampler_circuit = pm.run(measured_circuit)
             print(f"Transpiled circuit: {isa_circuit.depth()} depth, {isa_circuit.count_ops()} gates")
             
-            # CRITICAL FIX: Expand Hamiltonian to match transpiled circuit qubits
-            expanded_hamiltonian = self._expand_hamiltonian_to_backend(hamiltonian, isa_circuit.num_qubits)
+            # CRITICAL FIX: Map the Hamiltonian onto the physical qubits chosen by the transpiler
+            expanded_hamiltonian = hamiltonian.apply_layout(isa_circuit.layout)
             print(f"Expanded Hamiltonian to {isa_circuit.num_qubits} qubits")
             
             # Step 4: Run optimization with Session
@@ -318,46 +398,48 @@ class Magnificent_7:
                 estimator = Estimator(mode=session)
                 estimator.options.default_shots = 1024
                 
-                # Cost function for optimization
+                # Evaluate several parameter sets as PUBs of a single job,
+                # so queueing/upload overhead is paid once per batch
+                def cost_function_batch(param_list):
+                    pubs = [(isa_circuit, expanded_hamiltonian, p) for p in param_list]
+                    job = estimator.run(pubs)
+                    return [float(r.data.evs) for r in job.result()]
+                
+                # Cost function for optimization (SPSA passes a batch of points)
                 def cost_function(params):
-                    # Update circuit parameters
-                    job = estimator.run([(isa_circuit, expanded_hamiltonian, params)])
-                    result = job.result()
-                    return result[0].data.evs
+                    params = np.asarray(params)
+                    if params.ndim == 2:
+                        return cost_function_batch(params)
+                    return cost_function_batch([params])[0]
                 
                 # Initial parameters
                 initial_params = np.random.uniform(0, 2*np.pi, qaoa_circuit.num_parameters)
                 print(f"Starting optimization with {len(initial_params)} parameters...")
                 
-                # Classical optimization
-                result = minimize(
-                    cost_function,
-                    initial_params,
-                    method='COBYLA',
-                    options={'maxiter': max_iterations}
-                )
+                # Classical optimization: SPSA needs 2 evaluations per iteration,
+                # submitted together as one job. Fixed gains skip the calibration runs.
+                optimizer = SPSA(maxiter=max_iterations, learning_rate=0.1, perturbation=0.1)
+                optimizer.set_max_evals_grouped(2)
+                result = optimizer.minimize(cost_function, initial_params)
                 
-                print(f"Optimization completed: {result.success}")
+                print(f"Optimization completed: {result.nfev} evaluations")
                 print(f"Final cost: {result.fun}")
                 
                 # Get final solution by sampling
                 optimal_params = result.x
-                final_circuit = isa_circuit.assign_parameters(optimal_params)
                 
                 # Use SamplerV2 to get final bitstrings
                 from qiskit_ibm_runtime import SamplerV2 as Sampler
                 sampler = Sampler(mode=session)
                 sampler.options.default_shots = 1024
                 
-                # Add measurements to circuit
-                final_circuit.measure_all()
-                
-                job = sampler.run([final_circuit])
+                # Bind the optimal parameters to the pre-transpiled measured circuit
+                job = sampler.run([(isa_sampler_circuit, optimal_params)])
                 counts_result = job.result()
                 counts = counts_result[0].data.meas.get_counts()
                 
                 # Convert to optimization result format
-                optimization_result = self._process_qaoa_counts(counts, result.fun, isa_circuit)
+                optimization_result = self._process_qaoa_counts(counts, result.fun)
                 
             execution_time = time.time() - start_time
             print("Modern QAOA with V2 primitives succeeded!")
@@ -371,179 +453,69 @@ class Magnificent_7:
             execution_time = time.time() - start_time
             return None, execution_time
 
-    def _expand_hamiltonian_to_backend(self, hamiltonian, target_num_qubits):
-        """Expand Hamiltonian to match the number of qubits in the transpiled circuit"""
-        from qiskit.quantum_info import SparsePauliOp
-        
-        original_num_qubits = hamiltonian.num_qubits
-        if target_num_qubits == original_num_qubits:
-            return hamiltonian
+    def _bitstrings_to_array(self, bitstrings):
+        """Decode measured bitstrings (bit 0 rightmost) into a (K, n) int8 array of decision bits"""
+        width = len(bitstrings[0])
+        bits = (np.frombuffer(''.join(bitstrings).encode(), dtype=np.uint8)
+                .reshape(len(bitstrings), width)[:, ::-1] - ord('0')).astype(np.int8)
         
-        # Create new Pauli strings with additional identity operators
-        expanded_pauli_list = []
-        
-        for pauli_str, coeff in zip(hamiltonian.paulis, hamiltonian.coeffs):
-            # Convert to string representation
-            pauli_string = str(pauli_str)
-            
-            # Pad with identity operators to reach target size
-            padding_needed = target_num_qubits - original_num_qubits
-            expanded_pauli_string = pauli_string + 'I' * padding_needed
-            
-            expanded_pauli_list.append((expanded_pauli_string, coeff))
-        
-        return SparsePauliOp.from_list(expanded_pauli_list)
+        # Gather each decision variable from the classical bit that measured it
+        return bits[:, self._variable_to_clbit]
 
-    def _process_qaoa_counts(self, counts, objective_value, circuit):
+    def _process_qaoa_counts(self, counts, objective_value):
         """Process QAOA sampling results to extract solution"""
-        # Find the most probable bitstring
-        max_count = 0
-        best_bitstring = None
-        
-        for bitstring, count in counts.items():
-            if count > max_count:
-                max_count = count
-                best_bitstring = bitstring
-        
-        # Convert bitstring to solution vector
-        if best_bitstring:
-            # Get the mapping of logical to physical qubits
-            # We need to extract the original 7 qubits from the 127-qubit result
-            
-            # Find which physical qubits correspond to our logical qubits
-            x_opt = [0] * self.n
-            
-            try:
-                if hasattr(circuit, 'layout') and circuit.layout is not None:
-                    # Handle different layout types
-                    if hasattr(circuit.layout, 'get_virtual_bits'):
-                        # Old style layout
-                        physical_to_logical = {}
-                        for logical, physical in circuit.layout.get_virtual_bits().items():
-                            if logical.index < self.n:  # Only care about our problem qubits
-                                physical_to_logical[physical] = logical.index
-                        
-                        # Extract relevant bits
-                        for physical_idx, bit_value in enumerate(reversed(best_bitstring)):
-                            if physical_idx in physical_to_logical:
-                                logical_idx = physical_to_logical[physical_idx]
-                                x_opt[logical_idx] = int(bit_value)
-                    
-                    elif hasattr(circuit.layout, 'initial_layout'):
-                        # New style TranspileLayout
-                        initial_layout = circuit.layout.initial_layout
-                        if initial_layout is not None:
-                            # Map physical qubits back to logical qubits
-                            physical_to_logical = {}
-                            for logical_qubit, physical_qubit in initial_layout.items():
-                                if logical_qubit.index < self.n:
-                                    physical_to_logical[physical_qubit] = logical_qubit.index
-                            
-                            # Extract relevant bits
-                            for physical_idx, bit_value in enumerate(reversed(best_bitstring)):
-                                if physical_idx in physical_to_logical:
-                                    logical_idx = physical_to_logical[physical_idx]
-                                    x_opt[logical_idx] = int(bit_value)
-                        else:
-                            # Fallback: assume first n qubits are our problem qubits
-                            x_opt = [int(bit) for bit in best_bitstring[::-1][:self.n]]
-                    else:
-                        # Fallback: assume first n qubits are our problem qubits
-                        x_opt = [int(bit) for bit in best_bitstring[::-1][:self.n]]
-                else:
-                    # No layout info, use fallback
-                    x_opt = [int(bit) for bit in best_bitstring[::-1][:self.n]]
-                    
-            except Exception as layout_error:
-                print(f"Layout processing failed: {layout_error}")
-                print("Using fallback approach...")
-                # Fallback: assume first n qubits are our problem qubits
-                x_opt = [int(bit) for bit in best_bitstring[::-1][:self.n]]
-            
-            print(f"Extracted solution: {x_opt}")
-            print(f"Selected {sum(x_opt)} assets (expected {self.B})")
-            
-            # Create a mock result object similar to MinimumEigenOptimizer
-            class QAOAResult:
-                def __init__(self, x, fval):
-                    self.x = x
-                    self.fval = fval
-            
-            return QAOAResult(x_opt, objective_value)
-        
-        return None
+        if not counts:
+            return None
+        
+        bitstrings = list(counts)
+        X = self._bitstrings_to_array(bitstrings)
+        
+        # Start from the most probable bitstring
+        x_opt = X[bitstrings.index(max(counts, key=counts.get))]
+        
+        # Post-select: among sampled solutions that satisfy the budget, keep the
+        # one with the lowest QUBO objective
+        feasible = X[X.sum(axis=1) == self.B]
+        if len(feasible):
+            energies = ((feasible @ np.triu(self.qubo_matrix)) * feasible).sum(axis=1)
+            x_opt = feasible[int(np.argmin(energies))]
+        
+        print(f"Extracted solution: {x_opt}")
+        print(f"Selected {int(x_opt.sum())} assets (expected {self.B})")
+        
+        # Same result type MinimumEigenOptimizer returns on the simulator path
+        status = (OptimizationResultStatus.SUCCESS if self.program.is_feasible(x_opt)
+                  else OptimizationResultStatus.INFEASIBLE)
+        return OptimizationResult(
+            x=x_opt, fval=objective_value, variables=self.program.variables, status=status
+        )
 
     def _qubo_to_pauli_operator(self, qubo_matrix):
         """Convert QUBO matrix to SparsePauliOp for use with EstimatorV2"""
         from qiskit.quantum_info import SparsePauliOp
         
-        pauli_list = []
+        # Only the stored (nonzero) upper-triangle entries are visited
+        upper = sparse.triu(sparse.csr_matrix(qubo_matrix)).tocoo()
+        rows, cols, values = upper.row.tolist(), upper.col.tolist(), upper.data.tolist()
         
+        # QUBO index i sits at label position i, i.e. qubit n - 1 - i
         # Linear terms (diagonal)
-        for i in range(self.n):
-            if qubo_matrix[i, i] != 0:
-                pauli_str = 'I' * i + 'Z' + 'I' * (self.n - i - 1)
-                pauli_list.append((pauli_str, -0.5 * qubo_matrix[i, i]))
-                
+        sparse_list = [
+            ('Z', [self.n - 1 - i], -0.5 * q)
+            for i, j, q in zip(rows, cols, values) if i == j
+        ]
+        
         # Quadratic terms (off-diagonal)
-        for i in range(self.n):
-            for j in range(i + 1, self.n):
-                if qubo_matrix[i, j] != 0:
-                    pauli_str = ['I'] * self.n
-                    pauli_str[i] = 'Z'
-                    pauli_str[j] = 'Z'
-                    pauli_str = ''.join(pauli_str)
-                    pauli_list.append((pauli_str, 0.25 * qubo_matrix[i, j]))
+        sparse_list += [
+            ('ZZ', [self.n - 1 - i, self.n - 1 - j], 0.25 * q)
+            for i, j, q in zip(rows, cols, values) if i != j
+        ]
         
         # Constant term
-        constant = np.sum(np.diag(qubo_matrix)) * 0.5
-        pauli_list.append(('I' * self.n, constant))
-        
-        return SparsePauliOp.from_list(pauli_list)
-
-    def _process_qaoa_counts(self, counts, objective_value, circuit):
-        """Process QAOA sampling results to extract solution"""
-        # Find the most probable bitstring
-        max_count = 0
-        best_bitstring = None
-        
-        for bitstring, count in counts.items():
-            if count > max_count:
-                max_count = count
-                best_bitstring = bitstring
-        
-        # Convert bitstring to solution vector
-        if best_bitstring:
-            # Get the mapping of logical to physical qubits
-            # We need to extract the original 7 qubits from the 127-qubit result
-            
-            # Find which physical qubits correspond to our logical qubits
-            if hasattr(circuit, 'layout') and circuit.layout is not None:
-                # Use the layout to map back to logical qubits
-                physical_to_logical = {}
-                for logical, physical in circuit.layout.get_virtual_bits().items():
-                    if logical.index < self.n:  # Only care about our problem qubits
-                        physical_to_logical[physical] = logical.index
-                
-                # Extract relevant bits
-                x_opt = [0] * self.n
-                for physical_idx, bit_value in enumerate(reversed(best_bitstring)):
-                    if physical_idx in physical_to_logical:
-                        logical_idx = physical_to_logical[physical_idx]
-                        x_opt[logical_idx] = int(bit_value)
-            else:
-                # Fallback: assume first n qubits are our problem qubits
-                x_opt = [int(bit) for bit in best_bitstring[::-1][:self.n]]
-            
-            # Create a mock result object similar to MinimumEigenOptimizer
-            class QAOAResult:
-                def __init__(self, x, fval):
-                    self.x = x
-                    self.fval = fval
-            
-            return QAOAResult(x_opt, objective_value)
+        constant = upper.diagonal().sum() * 0.5
+        sparse_list.append(('', [], constant))
         
-        return None
+        return SparsePauliOp.from_sparse_list(sparse_list, num_qubits=self.n)
 
     def analyze_solution(self, result):
         """Analyze and display the optimization results"""
@@ -572,13 +544,14 @@ class Magnificent_7:
             if not selected_indices:  # No assets selected
                 return [], 0.0, 0.0, fval
             
-            portfolio_return = np.sum([self.mu[i, 0] for i in selected_indices])
+            # Binary weight vector of the selection
+            w = np.asarray(x_opt, dtype=np.float64)
+            
+            portfolio_return = float(w @ self.mu.ravel())
             
-            # Portfolio risk (variance)
-            portfolio_variance = 0
-            for i in selected_indices:
-                for j in selected_indices:
-                    portfolio_variance += self.sigma[i, j]
+            # Portfolio risk (variance), reusing sigma @ w
+            sigma_w = self.sigma @ w
+            portfolio_variance = float(w @ sigma_w)
             
             portfolio_risk = np.sqrt(max(0, portfolio_variance))  # Ensure non-negative
         
@@ -588,6 +561,13 @@ class Magnificent_7:
             print(f"Error analyzing solution: {e}")
             return None, None, None, None
 
+    def batch_portfolio_metrics(self, X):
+        """Portfolio returns and risks for K candidate selections stacked as a (K, n) array"""
+        X = np.asarray(X, dtype=np.float64)
+        returns = X @ self.mu.ravel()
+        variances = np.einsum('ki,ij,kj->k', X, self.sigma, X)
+        return returns, np.sqrt(np.maximum(variances, 0))  # Ensure non-negative
+
     def compare_optimizations(self):
         """Run both optimizations and compare results"""
         
@@ -613,8 +593,12 @@ class Magnificent_7:
             'success': sim_result is not None and sim_assets is not None
         }
         
-        # Run hardware optimization
-        hw_result, hw_time = self.hardware_optimization()
+        # Run hardware optimization (skipped entirely when no backend was found)
+        if self.backend:
+            hw_result, hw_time = self.hardware_optimization()
+        else:
+            print("\nNo Hardware Available - skipping hardware optimization")
+            hw_result, hw_time = None, 0
         hw_assets, hw_return, hw_risk, hw_objective = self.analyze_solution(hw_result)
         
         results['hardware'] = {
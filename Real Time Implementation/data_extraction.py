@@ -1,48 +1,191 @@
 """Extract Data from Alpha Vantage"""
 
-import requests
+import asyncio
+import aiohttp
+import orjson
+import numpy as np
 import pandas as pd
 import os
-from datetime import datetime
+import json
+import pathlib
+import threading
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 import warnings
-import schedule
 
 warnings.filterwarnings("ignore", category=FutureWarning)
 
 
 class DataExtraction():
-    def __init__(self):
+    def __init__(self, outputsize="compact"):
         self.tickers = ['AAPL', 'MSFT', 'GOOGL', 'AMZN', 'NVDA', 'TSLA', 'META']
         self.API = os.getenv('API_KEY')
 
-    def fetch_data(self):
-        for ticker in self.tickers:
-            url = (
-                "https://www.alphavantage.co/query"
-                f"?function=TIME_SERIES_DAILY"
-                f"&symbol={ticker}"
-                f"&outputsize=compact"
-                f"&apikey={self.API}"
+        # "compact" returns the latest 100 bars, "full" the whole history
+        if outputsize not in ("compact", "full"):
+            raise ValueError("outputsize must be 'compact' or 'full'")
+        self.outputsize = outputsize
+
+        # Alpha Vantage field names, in output column order
+        self.fields = ("1. open", "2. high", "3. low", "4. close", "5. volume")
+
+        # Output folder next to this script, created once
+        self._data_dir = pathlib.Path(__file__).resolve().parent / "Data"
+        self._data_dir.mkdir(parents=True, exist_ok=True)
+
+        # All tickers share one wide file with (ticker, field) columns
+        self.prices_path = self._data_dir / f"prices_{self.outputsize}.parquet"
+
+        # "3. Last Refreshed" stamps of the stored data, keyed by ticker
+        self._refreshed_path = self._data_dir / f".last_refreshed_{self.outputsize}.json"
+
+        # Connection pool and retry policy shared by all ticker requests
+        self.pool_size = 8
+        self.max_retries = 3
+        self.backoff_factor = 0.5
+        self.retry_statuses = {429, 500, 502, 503, 504}
+        self.timeout = aiohttp.ClientTimeout(total=15, connect=5)
+
+    async def _fetch_one(self, session, ticker):
+        """Fetch the daily time series for a single ticker"""
+        url = (
+            "https://www.alphavantage.co/query"
+            f"?function=TIME_SERIES_DAILY"
+            f"&symbol={ticker}"
+            f"&outputsize={self.outputsize}"
+            f"&apikey={self.API}"
+        )
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with session.get(url, timeout=self.timeout) as response:
+                    if response.status not in self.retry_statuses or attempt == self.max_retries:
+                        return ticker, await response.json(loads=orjson.loads)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                # Transient connection/timeout failures get the same backoff as retryable statuses
+                if attempt == self.max_retries:
+                    raise
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+
+    async def fetch_all(self, tickers=None):
+        """Fetch all tickers concurrently over a single pooled client session"""
+        tickers = self.tickers if tickers is None else tickers
+        connector = aiohttp.TCPConnector(limit=self.pool_size)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            return await asyncio.gather(
+                *(self._fetch_one(session, ticker) for ticker in tickers),
+                return_exceptions=True
             )
-            response = requests.get(url)
-            data = response.json()
+
+    def load_prices(self):
+        """Load the stored combined price file as a dict of per-ticker frames"""
+        try:
+            prices = pd.read_parquet(self.prices_path)
+        except (OSError, ValueError):
+            return {}
+        return {
+            ticker: prices[ticker].dropna(how="all")
+            for ticker in prices.columns.unique(level=0)
+        }
+
+    def expected_session(self):
+        """Date of the most recent US market session that has already closed"""
+        now = datetime.now(ZoneInfo("America/New_York"))
+        session = now.date() if now.hour >= 16 else now.date() - timedelta(days=1)
+
+        # Roll back over weekends (exchange holidays simply trigger a refetch)
+        while session.weekday() >= 5:
+            session -= timedelta(days=1)
+        return session
+
+    def is_up_to_date(self, df):
+        """Check whether stored bars already include the latest closed session"""
+        return not df.empty and df.index.max().date() >= self.expected_session()
+
+    def refresh_frames(self):
+        """
+        Fetch stale tickers and merge them into the stored frames
+        Returns (frames, last_refreshed, updated) without touching the disk
+        """
+        frames = self.load_prices()
+
+        # Skip the HTTP call entirely for tickers whose data is already current
+        stale_tickers = [
+            ticker for ticker in self.tickers
+            if ticker not in frames or not self.is_up_to_date(frames[ticker])
+        ]
+        if not stale_tickers:
+            print("All tickers are up to date")
+            return frames, None, False
+
+        try:
+            last_refreshed = json.loads(self._refreshed_path.read_text())
+        except (OSError, ValueError):
+            last_refreshed = {}
+
+        responses = asyncio.run(self.fetch_all(stale_tickers))
+        updated = False
+
+        for ticker, response in zip(stale_tickers, responses):
+            if isinstance(response, Exception):
+                print(f"[{ticker}] Request failed: {response}")
+                continue
+
+            _, data = response
             time_series = data.get("Time Series (Daily)")
             if time_series is None:
                 print(f"[{ticker}] Error or Rate Limit hit: {data}")
                 continue
 
-            df = pd.DataFrame.from_dict(time_series, orient="index")
-            df.index = pd.to_datetime(df.index)
-            df.columns = ["open", "high", "low", "close", "volume"]
-            df = df.sort_index()
+            # Keep the stored bars when Alpha Vantage has nothing newer
+            refreshed = data.get("Meta Data", {}).get("3. Last Refreshed")
+            if refreshed is not None and last_refreshed.get(ticker) == refreshed and ticker in frames:
+                continue
+
+            # Build typed arrays straight from the JSON payload, oldest bar first
+            items = sorted(time_series.items())
+            dates = np.array([date for date, _ in items], dtype="datetime64[D]")
+            values = np.fromiter(
+                (float(bar[field]) for _, bar in items for field in self.fields),
+                dtype=np.float64,
+                count=len(items) * len(self.fields)
+            ).reshape(-1, len(self.fields))
+
+            frames[ticker] = pd.DataFrame(
+                values,
+                index=pd.DatetimeIndex(dates),
+                columns=["open", "high", "low", "close", "volume"]
+            )
+            last_refreshed[ticker] = refreshed
+            updated = True
 
-            folder_path = r"Real Time Implementation\Data"
-            os.makedirs(folder_path, exist_ok=True)
+        return frames, last_refreshed, updated
 
-            file_name = f"{ticker}_yearly_data_compact.csv"
-            file_path = os.path.join(folder_path, file_name)
+    def save_frames(self, frames, last_refreshed, updated):
+        """Write the combined price file and Last Refreshed stamps"""
+        if updated:
+            tickers = [ticker for ticker in self.tickers if ticker in frames]
+            prices = pd.concat([frames[ticker] for ticker in tickers], axis=1, keys=tickers)
+            prices.to_parquet(self.prices_path, engine="pyarrow", compression="zstd")
 
-            df.to_csv(file_path, index=True)
+        if last_refreshed is not None:
+            self._refreshed_path.write_text(json.dumps(last_refreshed, indent=2))
+
+    def fetch_data(self):
+        self.save_frames(*self.refresh_frames())
+
+    def fetch_data_in_memory(self):
+        """Fetch data and return the per-ticker frames, writing them to disk in the background"""
+        frames, last_refreshed, updated = self.refresh_frames()
+
+        # Callers use the returned frames directly, the file is kept for audit and restarts
+        writer = threading.Thread(target=self.save_frames, args=(dict(frames), last_refreshed, updated))
+        writer.start()
+
+        return frames
 
     # def refresh(self):
-    #     schedule.every().day.at("07:00", "America/New_York").do(self.fetch_data)
\ No newline at end of file
+    #     schedule.every().day.at("07:00", "America/New_York").do(self.fetch_data)
+
+
+if __name__ == "__main__":
+    DataExtraction().fetch_data()
@@ -1,19 +1,7 @@
 from qaoa import QAOA
 from data_extraction import DataExtraction
 
-
-# Extract Data
-data = DataExtraction()
-data.fetch_data()
-
-# Top 3 stocks from the Magnificent 7 stocks
-qaoa = QAOA(B=3)
-
-# Receive the results of the optimization
-results = qaoa.run_optimization()
-
 from flask import Flask, render_template_string
-from apscheduler.schedulers.background import BackgroundScheduler
 from datetime import datetime
 
 # Your QAOA optimizer import here:
@@ -27,8 +15,12 @@ latest_result = {}
 def run_qaoa_job():
     print(f"Running QAOA job at {datetime.now()}")
 
-    # Replace this with your real run
-    qaoa = QAOA(B=3)
+    # Extract Data and hand it to the optimizer without re-reading it from disk
+    extractor = DataExtraction()
+    df_dict = extractor.fetch_data_in_memory()
+
+    # Top 3 stocks from the Magnificent 7 stocks
+    qaoa = QAOA(B=3, data=df_dict)
     result = qaoa.run_optimization()
     
     global latest_result
@@ -36,11 +28,6 @@ def run_qaoa_job():
 
     print("QAOA optimization complete!")
 
-# Schedule it for every day at 09:30
-scheduler = BackgroundScheduler()
-scheduler.add_job(run_qaoa_job, 'cron', hour=8, minute=0)
-scheduler.start()
-
 @app.route("/")
 def home():
     global latest_result
@@ -56,3 +43,18 @@ def home():
     <p>Objective value: {latest_result['objective_value']:.4f}</p>
     """
     return html
+
+
+if __name__ == "__main__":
+    # Initial result so the page has data before the first scheduled run
+    run_qaoa_job()
+
+    # Only start the scheduler thread when serving, not on import
+    from apscheduler.schedulers.background import BackgroundScheduler
+
+    # Schedule it for every day at 09:30
+    scheduler = BackgroundScheduler()
+    scheduler.add_job(run_qaoa_job, 'cron', hour=8, minute=0)
+    scheduler.start()
+
+    app.run()
@@ -1,26 +1,39 @@
 # QAOA-Based Portfolio Optimization
 
-# Optimization modeling
-from qiskit_optimization import QuadraticProgram
-from qiskit_optimization.algorithms import MinimumEigenOptimizer
-
-# QAOA & optimizer
-from qiskit_algorithms import QAOA
-from qiskit_algorithms.optimizers import COBYLA
-
-# Aer Sampler primitive for QAOA
-from qiskit_aer.primitives import Sampler
+# Qiskit modules are imported inside the methods that use them,
+# so importing this module stays cheap until a solve actually runs
 
 # Numerical & stock data libraries
 import numpy as np
 import pandas as pd
+import hashlib
+import itertools
+from collections import namedtuple
+import pathlib
+import pickle
 import warnings
 
 # Suppress specific deprecation warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning, module="qiskit_aer")
 
+# Folder written by DataExtraction
+DATA_DIR = pathlib.Path(__file__).resolve().parent / "Data"
+
+# Persisted (mu, sigma) so scheduled runs survive process restarts
+STATS_CACHE_PATH = DATA_DIR / ".stats_cache.pkl"
+
+# Precision of mu/sigma; bump the version whenever their layout or computation changes
+STATS_DTYPE = np.float32
+STATS_CACHE_VERSION = 2
+
+# x/fval pair returned by the classical solver, which runs without importing Qiskit
+SolverResult = namedtuple("SolverResult", "x fval")
+
 class QAOA:
-    def __init__(self, B):
+    # In-process (mu, sigma) cache keyed by price-data fingerprint
+    _stats_cache = {}
+
+    def __init__(self, B, data=None, outputsize="compact"):
         # Tickers of Magnificent 7 stocks
         self.tickers = ['AAPL', 'MSFT', 'GOOGL', 'AMZN', 'NVDA', 'TSLA', 'META']
         self.n = len(self.tickers)
@@ -31,50 +44,108 @@ class QAOA:
         
         self.B = B
         
+        # Which DataExtraction price file to read ("compact" or "full")
+        if outputsize not in ("compact", "full"):
+            raise ValueError("outputsize must be 'compact' or 'full'")
+        self.prices_path = DATA_DIR / f"prices_{outputsize}.parquet"
+        
         # Expected Returns and Covariance Matrix
-        self.mu = np.empty((self.n, 1))
-        self.sigma = np.empty((self.n, self.n))
+        self.mu = np.empty((self.n, 1), dtype=np.float32)
+        self.sigma = np.empty((self.n, self.n), dtype=np.float32)
 
         # Parameters for QUBO formulation
         self.risk_aversion = 1.0  # Risk aversion parameter
         self.penalty_strength = 10.0  # Penalty for constraint violation
 
         # QUBO Matrix for QAOA Optimization
-        self.qubo_matrix = np.empty((self.n, self.n))
+        self.qubo_matrix = np.empty((self.n, self.n), dtype=np.float32)
+
+        # Quadratic program, built on first use and patched on later runs
+        self._program = None
 
-        self.data = self.download_data()
+        # Aer sampler, created on first solve and reused afterwards
+        self.shots = 1024
+        self._sampler = None
+
+        # Use per-ticker frames handed over in memory, otherwise read them from disk
+        if data is None:
+            self.data = self.download_data()
+        else:
+            frames = pd.concat({ticker: data[ticker]["close"] for ticker in self.tickers}, axis=1)
+            # Only keep dates every ticker has (stale and fresh frames can cover different windows)
+            self.data = frames.dropna(how="any")
+
+        if len(self.data) < 2:
+            raise ValueError("Not enough dates shared by all tickers to compute returns")
 
         ## Download Data and Compute Returns
     
     def download_data(self):
-        data = {}
-        for ticker in self.tickers:
-            file_path = f"Real Time Implementation/Data/{ticker}_yearly_data_compact.csv"
-            df = pd.read_csv(file_path)
-            data[ticker] = df
-        return data
+        """Load closing prices into one date-aligned frame with a column per ticker"""
+        prices = pd.read_parquet(self.prices_path)
+        # Only keep dates every ticker has (stale and fresh frames can cover different windows)
+        return prices.xs("close", axis=1, level=1)[self.tickers].dropna(how="any")
 
     def compute_returns(self):
-        all_returns = []
+        """Compute daily returns matrix"""
+        closes = self.data.to_numpy(dtype=np.float64)
 
-        for ticker in self.tickers:
-            prices = self.data[ticker]["close"]
-            daily_returns = prices.pct_change().iloc[1:].values
-            all_returns.append(daily_returns)
+        # Drop days with a missing close for any ticker so no NaN reaches the returns
+        closes = closes[np.isfinite(closes).all(axis=1)]
+        if len(closes) < 2:
+            raise ValueError("Insufficient data to compute returns")
 
-        returns_matrix = np.array(all_returns).T
-        return returns_matrix
+        return closes[1:] / closes[:-1] - 1.0
 
     def compute_mu(self, returns_matrix):
         """Compute expected returns (mean of historical returns)"""
-        self.mu = np.mean(returns_matrix, axis=0).reshape(-1, 1)
+        self.mu = np.mean(returns_matrix, axis=0).reshape(-1, 1).astype(STATS_DTYPE, copy=False)
         return self.mu
 
     def covariance_matrix(self, returns_matrix):
         """Compute covariance matrix of returns"""
-        self.sigma = np.cov(returns_matrix.T)
+        self.sigma = np.cov(returns_matrix, rowvar=False).astype(STATS_DTYPE, copy=False)
         return self.sigma
 
+    def data_fingerprint(self):
+        """Hash the loaded price data to detect unchanged inputs between runs"""
+        row_hashes = pd.util.hash_pandas_object(self.data).values
+        return hashlib.blake2b(row_hashes.tobytes()).hexdigest()
+
+    def compute_statistics(self):
+        """Compute expected returns and covariance, reusing cached values when the data is unchanged"""
+        # Tag the key so entries written with another dtype or cache format are never reused
+        data_hash = f"v{STATS_CACHE_VERSION}-{np.dtype(STATS_DTYPE).str}-{self.data_fingerprint()}"
+
+        if data_hash not in self._stats_cache:
+            # Any unreadable or foreign payload is just a cache miss
+            try:
+                with open(STATS_CACHE_PATH, "rb") as f:
+                    payload = pickle.load(f)
+            except Exception:
+                payload = None
+            if isinstance(payload, dict):
+                self._stats_cache.update(payload)
+
+        if data_hash in self._stats_cache:
+            self.mu, self.sigma = self._stats_cache[data_hash]
+            return self.mu, self.sigma
+
+        returns_matrix = self.compute_returns()
+        mu = self.compute_mu(returns_matrix)
+        sigma = self.covariance_matrix(returns_matrix)
+
+        # Only the latest fingerprint is persisted; older data is never reused
+        self._stats_cache[data_hash] = (mu, sigma)
+        try:
+            with open(STATS_CACHE_PATH, "wb") as f:
+                pickle.dump({data_hash: (mu, sigma)}, f)
+        except OSError as e:
+            # The cache is only an optimization; keep the freshly computed statistics
+            print(f"Could not write statistics cache: {e}")
+
+        return mu, sigma
+
     def build_qubo_matrix(self, mu, sigma):
         """
         Build QUBO matrix for portfolio optimization
@@ -85,65 +156,74 @@ class QAOA:
         Q_ij = risk_aversion * sigma_ij + 2 * penalty (for i != j)
         """
         
-        # Initialize QUBO matrix
-        self.qubo_matrix = np.zeros((self.n, self.n))
-        
-        # Diagonal terms: individual asset risk and return, plus penalty
-        for i in range(self.n):
-            self.qubo_matrix[i, i] = (self.risk_aversion * sigma[i, i] - mu[i, 0] + self.penalty_strength * (1 - 2 * self.B))
-        
         # Off-diagonal terms: covariance and penalty
-        for i in range(self.n):
-            for j in range(i + 1, self.n):
-                covariance_term = self.risk_aversion * sigma[i, j]
-                penalty_term = 2 * self.penalty_strength
-                
-                self.qubo_matrix[i, j] = covariance_term + penalty_term
-                self.qubo_matrix[j, i] = covariance_term + penalty_term
+        self.qubo_matrix = self.risk_aversion * sigma + 2 * self.penalty_strength
+
+        # Diagonal terms: individual asset risk and return, plus penalty
+        np.fill_diagonal(self.qubo_matrix, self.risk_aversion * np.diag(sigma) - mu.ravel() + self.penalty_strength * (1 - 2 * self.B))
         
         return self.qubo_matrix
 
     def build_quadratic_program(self, qubo):
         """Build quadratic program for Qiskit optimization"""
-        program = QuadraticProgram()
+        # Variables and constraint only depend on n and B, so build them once
+        if self._program is None:
+            # Optimization modeling
+            from qiskit_optimization import QuadraticProgram
+
+            program = QuadraticProgram()
+
+            # Add binary variables for each asset
+            for i in range(self.n):
+                program.binary_var(name=f"x{i}")
+
+            program.minimize()
 
-        # Add binary variables for each asset
-        for i in range(self.n):
-            program.binary_var(name=f"x{i}")
+            # Add constraint: select exactly B assets
+            program.linear_constraint(
+                linear={i: 1 for i in range(self.n)},
+                sense="==",
+                rhs=self.B,
+                name="asset_selection"
+            )
 
-        # Build objective function from QUBO matrix
-        linear = {}
-        quadratic = {}
+            self._program = program
 
         # Linear terms (diagonal of QUBO)
-        for i in range(self.n):
-            linear[i] = qubo[i, i]
-
-        # Quadratic terms (off-diagonal of QUBO)
-        for i in range(self.n):
-            for j in range(i + 1, self.n):
-                if qubo[i, j] != 0:
-                    quadratic[(i, j)] = qubo[i, j]
-
-        program.minimize(linear=linear, quadratic=quadratic)
-        
-        # Add constraint: select exactly B assets
-        program.linear_constraint(
-            linear={i: 1 for i in range(self.n)},
-            sense="==",
-            rhs=self.B,
-            name="asset_selection"
+        self._program.objective.linear = dict(enumerate(qubo.diagonal().tolist()))
+
+        # Quadratic terms (nonzero upper triangle of QUBO)
+        rows, cols = np.triu_indices(self.n, k=1)
+        values = qubo[rows, cols]
+        mask = values != 0
+        self._program.objective.quadratic = dict(
+            zip(zip(rows[mask].tolist(), cols[mask].tolist()), values[mask].tolist())
         )
 
-        return program
+        return self._program
 
     def quantum_optimizer(self, program, max_iterations=200):
         """Run QAOA optimization"""
+        # Optimization modeling
+        from qiskit_optimization.algorithms import MinimumEigenOptimizer
+
+        # QAOA & optimizer (aliased, this module's own class is also named QAOA)
+        from qiskit_algorithms import QAOA as QAOASolver
+        from qiskit_algorithms.optimizers import COBYLA
+
+        # Aer Sampler primitive for QAOA
+        from qiskit_aer.primitives import Sampler
+
         try:
-            # Set up QAOA with more iterations using SamplerV2
-            sampler = Sampler()
+            # Reuse one statevector sampler with an explicit shot count across runs
+            if self._sampler is None:
+                self._sampler = Sampler(
+                    run_options={"shots": self.shots},
+                    backend_options={"method": "statevector"}
+                )
+            sampler = self._sampler
             optimizer = COBYLA(maxiter=max_iterations)
-            qaoa = QAOA(sampler=sampler, optimizer=optimizer, reps=2)  # 2 QAOA layers
+            qaoa = QAOASolver(sampler=sampler, optimizer=optimizer, reps=2)  # 2 QAOA layers
 
             solver = MinimumEigenOptimizer(qaoa)
             result = solver.solve(program)
@@ -152,6 +232,19 @@ class QAOA:
         except Exception as e:
             raise Exception(f"Optimization failed: {str(e)}")
 
+    def solve_classical(self, qubo):
+        """Exactly solve the QUBO by scoring every selection of B assets"""
+        # One-hot matrix of all C(n, B) feasible selections
+        combos = np.array(list(itertools.combinations(range(self.n), self.B)))
+        X = np.zeros((len(combos), self.n))
+        X[np.arange(len(combos))[:, None], combos] = 1
+
+        # Same objective as the quadratic program: diagonal plus each pair once
+        values = ((X @ np.triu(qubo)) * X).sum(axis=1)
+        best = np.argmin(values)
+
+        return SolverResult(X[best], float(values[best]))
+
     def analyze_solution(self, result):
         """Analyze and display the optimization results"""
         if result.x is None:
@@ -161,39 +254,34 @@ class QAOA:
         x_opt = result.x
         fval = result.fval
         
+        # Binary selection vector
+        x = np.asarray(x_opt, dtype=float)
+        
         # Get selected assets
-        selected_assets = [self.tickers[i] for i in range(self.n) if x_opt[i] == 1]
+        selected_assets = [ticker for ticker, bit in zip(self.tickers, x) if bit == 1]
         
         # Calculate portfolio metrics
-        selected_indices = [i for i in range(self.n) if x_opt[i] == 1]
+        portfolio_return = float(self.mu.ravel() @ x)
         
-        if len(selected_indices) > 0:
-            portfolio_return = np.sum([self.mu[i, 0] for i in selected_indices])
-            
-            # Portfolio risk (variance)
-            portfolio_variance = 0
-            for i in selected_indices:
-                for j in selected_indices:
-                    if i == j:
-                        portfolio_variance += self.sigma[i, j]
-                    else:
-                        portfolio_variance += 2 * self.sigma[i, j]
-            portfolio_variance *= 0.5
-            portfolio_risk = np.sqrt(portfolio_variance)
-        else:
-            portfolio_return = 0
-            portfolio_risk = 0
+        # Portfolio risk (variance)
+        portfolio_variance = x @ self.sigma @ x
+        portfolio_risk = float(np.sqrt(portfolio_variance))
         
         return selected_assets, portfolio_return, portfolio_risk, fval
 
-    def run_optimization(self):
-        """Run the complete optimization process"""
+    def run_optimization(self, method="classical"):
+        """
+        Run the complete optimization process
+        method="classical" enumerates all feasible selections exactly,
+        method="qaoa" runs the QAOA solver on the Aer simulator
+        """
+        if method not in ("classical", "qaoa"):
+            raise ValueError("method must be 'classical' or 'qaoa'")
+
         print("Computing returns and statistics...")
         
-        # Compute returns and statistics
-        returns_matrix = self.compute_returns()
-        mu = self.compute_mu(returns_matrix)
-        sigma = self.covariance_matrix(returns_matrix)
+        # Compute returns and statistics (cached while the price data is unchanged)
+        mu, sigma = self.compute_statistics()
         
         print(f"Expected returns: {mu.flatten()}")
         print(f"Risk (std dev): {np.sqrt(np.diag(sigma))}")
@@ -201,13 +289,19 @@ class QAOA:
         # Build QUBO matrix
         qubo_matrix = self.build_qubo_matrix(mu, sigma)
         
-        # Create optimization program
-        program = self.build_quadratic_program(qubo_matrix)
-        
-        print("Running QAOA optimization...")
-        
-        # Run optimization
-        result = self.quantum_optimizer(program)
+        if method == "classical":
+            print("Running exhaustive classical optimization...")
+            
+            # Run optimization
+            result = self.solve_classical(qubo_matrix)
+        else:
+            # Create optimization program
+            program = self.build_quadratic_program(qubo_matrix)
+            
+            print("Running QAOA optimization...")
+            
+            # Run optimization
+            result = self.quantum_optimizer(program)
         
         # Analyze results
         selected_assets, portfolio_return, portfolio_risk, objective_value = self.analyze_solution(result)
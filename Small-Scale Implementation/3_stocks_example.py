@@ -22,25 +22,24 @@ returns = np.array([
   [-0.005, -0.002, -0.003],
   [0.006, 0.003, 0.005],
   [0.011, 0.007, 0.010]
-])
+], dtype=np.float32)
 
 # Stocks chosen for optimization
 stock_names = ["GOOG", "MSFT", "AAPL"]
 
 # Step 1: Compute mean return vector μ
-mu = np.empty((3, 1))
 
 def compute_mean():
-    for i in range(3):
-        mu[i] = np.mean(returns[:, i])
-    return mu
+    return returns.mean(axis=0, keepdims=True).T  # Column vector, one mean per stock
 
 mu = compute_mean()
 
 # Step 2: Compute covariance matrix
 
 def covariance_matrix():
-    return np.cov(returns.T)  # Transpose so each column is a stock
+    # Each column is a stock: centered Gram matrix over the T - 1 degrees of freedom
+    centered = returns - returns.mean(axis=0)
+    return (centered.T @ centered) / (returns.shape[0] - 1)
 
 sigma = covariance_matrix()
 
@@ -51,15 +50,11 @@ lam = 0.01   # Penalty strength
 B = 2        # Budget: choose 2 out of 3 stocks
 
 def qubo_matrix():
-    qubo = np.empty((3, 3))
-    for i in range(3):
-        for j in range(3):
-            if i == j:
-                # Diagonal: risk + penalty - reward
-                qubo[i][i] = q * sigma[i][i] - mu[i].item() + lam * (1 - 2 * B)
-            else:
-                # Non-diagonal: cross-covariance + penalty interaction
-                qubo[i][j] = q * sigma[i][j] + 2 * lam
+    # Non-diagonal: cross-covariance + penalty interaction
+    qubo = q * sigma + 2 * lam
+
+    # Diagonal: risk + penalty - reward
+    np.fill_diagonal(qubo, q * np.diag(sigma) - mu.ravel() + lam * (1 - 2 * B))
     return qubo
 
 qubo = qubo_matrix()
@@ -72,18 +67,10 @@ program = QuadraticProgram()
 for i in range(3):
     program.binary_var(name=f"x{i}")
 
-# Build objective from QUBO matrix
-linear_coeffs = {}
-quadratic_coeffs = {}
-
-for i in range(3):
-    linear_coeffs[i] = qubo[i][i]
-    for j in range(i + 1, 3):
-        quadratic_coeffs[(i, j)] = 2 * qubo[i][j]  # Doubles off-diagonal terms
-
-program.objective.linear = linear_coeffs
-program.objective.quadratic = quadratic_coeffs
-program.minimize()
+# Build objective from QUBO matrix in one call:
+# diagonal as linear terms, full off-diagonal matrix as x^T Q x (counts each pair twice)
+diag = np.diag(qubo)
+program.minimize(linear=diag.astype(np.float64), quadratic=(qubo - np.diagflat(diag)).astype(np.float64))
 
 # Add budget constraint: select exactly 2 assets
 program.linear_constraint(
@@ -101,8 +88,11 @@ sampler = AerSampler()
 # Classical optimizer COBYLA
 optimizer = COBYLA(maxiter=30)
 
-# Create QAOA instance with 1 repetition
-qaoa = QAOA(sampler=sampler, optimizer=optimizer, reps=1)
+# Warm-start angles (beta, gamma) instead of a random initial point
+initial_point = np.array([-np.pi / 8, 0.1])
+
+# Create QAOA instance with 1 repetition, scoring only the best 25% of samples (CVaR)
+qaoa = QAOA(sampler=sampler, optimizer=optimizer, reps=1, aggregation=0.25, initial_point=initial_point)
 
 # Wrap QAOA in classical optimizer interface
 solver = MinimumEigenOptimizer(qaoa)
@@ -113,12 +103,7 @@ result = solver.solve(program)
 # Step 6: Display the result
 
 # Extract selected stocks from bitstring solution
-zipped = zip(result.x, stock_names)
-selected_stocks = []
-
-for bit, stock in zipped:
-    if bit == 1:
-        selected_stocks.append(stock)
+selected_stocks = np.asarray(stock_names)[np.asarray(result.x).astype(bool)].tolist()
 
 
 # Output
@@ -3,27 +3,77 @@
 
 # Optimization modeling
 from qiskit_optimization import QuadraticProgram
-from qiskit_optimization.algorithms import MinimumEigenOptimizer
+from qiskit_optimization.algorithms import OptimizationResult, OptimizationResultStatus
+from qiskit_optimization.converters import QuadraticProgramToQubo
 
-# QAOA & optimizer
-from qiskit_algorithms import QAOA
-from qiskit_algorithms.optimizers import COBYLA
+# QAOA ansatz & optimizer
+from qiskit import transpile
+from qiskit.circuit.library import QAOAAnsatz
+from qiskit_algorithms.optimizers import COBYLA, SPSA
 
-# Aer Sampler primitive for QAOA
-from qiskit_aer.primitives import Sampler
+# Aer simulator and Sampler primitive for QAOA
+from qiskit_aer import AerSimulator
+from qiskit_aer.primitives import SamplerV2 as Sampler
 
 # Numerical & stock data libraries
 import numpy as np
 import yfinance as yf
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
+import hashlib
+import pathlib
 import warnings
 
+# JIT compilation for the numeric classical-prep kernel
+from numba import njit
+
 # Suppress specific deprecation warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning, module="qiskit_aer")
 
+# On-disk cache for downloaded prices
+CACHE_DIR = pathlib.Path.home() / ".cache" / "qfolio"
+
+
+def _cache_path(tickers, days, interval, start, end_date):
+    """Cache file for a price request, or None while the window still reaches past today"""
+    if pd.Timestamp(end_date) > pd.Timestamp.today().normalize():
+        return None  # Later bars are still to come, so the download is not final
+    cache_key = repr((tuple(sorted(tickers)), days, interval, start, end_date))
+    return CACHE_DIR / f"{hashlib.md5(cache_key.encode()).hexdigest()}.parquet"
+
+
+@njit(cache=True, fastmath=True)
+def _classical_prep(returns, risk_aversion, penalty_strength, B, mu, sigma, qubo):
+    """
+    Fused returns -> (mu, sigma, qubo): one pass for the means, one matmul for the covariance
+    Results are written into the preallocated mu (n,), sigma (n, n) and qubo (n, n) buffers
+    """
+    T, n = returns.shape
+    mu[:] = 0
+    
+    # Expected returns
+    for t in range(T):
+        for i in range(n):
+            mu[i] += returns[t, i]
+    mu /= T
+    
+    # Covariance as the centered Gram matrix: one BLAS matmul
+    centered = returns - mu
+    sigma[:, :] = (np.ascontiguousarray(centered.T) @ centered) / (T - 1)
+    
+    # QUBO assembly straight from the covariance
+    for i in range(n):
+        for j in range(n):
+            if i == j:
+                qubo[i, i] = risk_aversion * sigma[i, i] - mu[i] + penalty_strength * (1 - 2 * B)
+            else:
+                qubo[i, j] = risk_aversion * sigma[i, j] + 2 * penalty_strength
+    
+    return mu, sigma, qubo
+
+
 class Magnificent_7:
-    def __init__(self, B, days, interval, start):
+    def __init__(self, B, days, interval, start, optimizer="cobyla"):
         # Tickers of Magnificent 7 stocks
         self.tickers = ['AAPL', 'MSFT', 'GOOGL', 'AMZN', 'NVDA', 'TSLA', 'META']
         self.n = len(self.tickers)
@@ -34,32 +84,57 @@ class Magnificent_7:
         
         self.B = B
         
+        # Classical optimizer for the QAOA angles
+        if optimizer not in ("spsa", "cobyla"):
+            raise ValueError("optimizer must be 'spsa' or 'cobyla'")
+        self.optimizer = optimizer
+        
         # Download Data from Yahoo Finance
         self.data = self._download_data(days, interval, start)
 
         # Expected Returns and Covariance Matrix
-        self.mu = np.empty((self.n, 1))
-        self.sigma = np.empty((self.n, self.n))
+        self.mu = np.empty((self.n, 1), dtype=np.float32)
+        self.sigma = np.empty((self.n, self.n), dtype=np.float32)
 
         # Parameters for QUBO formulation
         self.risk_aversion = 1.0  # Risk aversion parameter
         self.penalty_strength = 10.0  # Penalty for constraint violation
 
         # QUBO Matrix for QAOA Optimization
-        self.qubo_matrix = np.empty((self.n, self.n))
+        self.qubo_matrix = np.empty((self.n, self.n), dtype=np.float32)
+
+        # Variables and constraint only depend on n and B, so the program is built once
+        # and build_quadratic_program only replaces the objective coefficients
+        self._program = QuadraticProgram()
+
+        # Add binary variables for each asset
+        for i in range(self.n):
+            self._program.binary_var(name=f"x{i}")
+
+        self._program.minimize()
+
+        # Add constraint: select exactly B assets
+        self._program.linear_constraint(
+            linear={i: 1 for i in range(self.n)},
+            sense="==",
+            rhs=self.B,
+            name="asset_selection"
+        )
 
     def _download_data(self, days, interval, start):
         """Download data with proper error handling and automatic end date calculation"""
     
-        # Convert start date string to datetime object
-        start_date = datetime.strptime(start, '%Y-%m-%d')
-        
-        # Calculate end date by adding the specified number of days
-        # We add extra days to account for weekends and holidays
-        # Typically need about 1.4x calendar days to get the desired trading days
-        calendar_days_needed = int(days * 1.4) + 7  # Add weekends/holidays
-        end_date = start_date + timedelta(days=calendar_days_needed)
-        end_date = end_date.strftime('%Y-%m-%d')
+        # Calculate end date as the requested number of business days after start
+        # (+2 covers the exclusive end date and an occasional holiday)
+        start_date = pd.Timestamp(start)
+        end_date = (start_date + pd.tseries.offsets.BDay(days + 2)).strftime('%Y-%m-%d')
+        
+        # Reuse a previous download of the same request when available
+        cache_path = _cache_path(self.tickers, days, interval, start, end_date)
+        if cache_path is not None and cache_path.exists():
+            data = pd.read_parquet(cache_path, engine="pyarrow")[self.tickers]
+            print(f"Loaded {len(data)} trading days of cached data from {start} to {end_date}")
+            return data
         
         print(f"Downloading data from {start} to {end_date} (to get ~{days} trading days)")
         
@@ -70,6 +145,9 @@ class Magnificent_7:
             interval=interval,
             auto_adjust=True,
             rounding=True,
+            actions=False,  # Skip dividend/split columns
+            threads=True,  # Fetch tickers concurrently
+            group_by='column',
             progress=False
         )['Close']
         
@@ -77,7 +155,10 @@ class Magnificent_7:
         if len(self.tickers) == 1:
             data = pd.DataFrame(data, columns=self.tickers)
         
-        # Limit to the requested number of days
+        # yfinance returns columns sorted by symbol; keep them in self.tickers order
+        data = data[self.tickers]
+        
+        # Safety net: limit to the requested number of days
         if len(data) > days:
             data = data.tail(days)  # Take the most recent 'days' trading days
         
@@ -87,102 +168,136 @@ class Magnificent_7:
         actual_days = len(data)
         print(f"Successfully downloaded {actual_days} trading days of data")
         
+        if cache_path is not None:
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            data.to_parquet(cache_path, engine="pyarrow", compression="zstd")
+        
         return data
             
     def compute_returns(self):
         """Compute daily returns matrix"""
-        returns = self.data.pct_change().dropna()
+        closes = self.data.to_numpy(dtype=np.float64, copy=False)
+        
+        # Drop days with a missing price for any ticker (holidays, misaligned rows)
+        closes = closes[np.isfinite(closes).all(axis=1)]
         
-        if returns.empty:
+        # Simple returns in one pass: p_t / p_{t-1} - 1 (no leading NaN row to drop)
+        returns_matrix = closes[1:] / closes[:-1] - 1.0
+        
+        if len(returns_matrix) == 0:
             raise ValueError("Insufficient data to compute returns")
             
-        returns_matrix = returns.to_numpy()
-        return returns_matrix
+        # Statistics downstream only need single precision
+        return returns_matrix.astype(np.float32)
     
-    def compute_mu(self, returns_matrix):
-        """Compute expected returns (mean of historical returns)"""
-        self.mu = np.mean(returns_matrix, axis=0).reshape(-1, 1)
-        return self.mu
-
-    def covariance_matrix(self, returns_matrix):
-        """Compute covariance matrix of returns"""
-        self.sigma = np.cov(returns_matrix.T)
-        return self.sigma
-
-    def build_qubo_matrix(self, mu, sigma, risk_aversion, penalty_strength, B):
+    def classical_prep(self, returns_matrix):
         """
-        Build QUBO matrix for portfolio optimization
+        Compute mu, sigma and the QUBO matrix in a single JIT-compiled kernel
         Objective: Minimize risk - expected_return + penalty for constraint violation
         
         The QUBO formulation for selecting exactly B assets:
         Q_ii = risk_aversion * sigma_ii - mu_i + penalty * (1 - 2*B)
         Q_ij = risk_aversion * sigma_ij + 2 * penalty (for i != j)
-        """
-        
-        # Initialize QUBO matrix
-        self.qubo_matrix = np.zeros((self.n, self.n))
-        
-        # Diagonal terms: individual asset risk and return, plus penalty
-        for i in range(self.n):
-            self.qubo_matrix[i, i] = (risk_aversion * sigma[i, i] - mu[i, 0] + penalty_strength * (1 - 2 * B))
-        
-        # Off-diagonal terms: covariance and penalty
-        for i in range(self.n):
-            for j in range(i + 1, self.n):
-                covariance_term = risk_aversion * sigma[i, j]
-                penalty_term = 2 * penalty_strength
-                
-                self.qubo_matrix[i, j] = covariance_term + penalty_term
-                self.qubo_matrix[j, i] = covariance_term + penalty_term
         
-        return self.qubo_matrix
+        The returned mu, sigma and qubo are the instance buffers themselves, not copies:
+        the next call overwrites them in place, so copy them to keep results across a sweep.
+        """
+        _classical_prep(
+            np.ascontiguousarray(returns_matrix, dtype=np.float32),
+            float(self.risk_aversion), float(self.penalty_strength), int(self.B),
+            self.mu.reshape(-1), self.sigma, self.qubo_matrix
+        )
+        return self.mu, self.sigma, self.qubo_matrix
 
     def build_quadratic_program(self, qubo):
         """Build quadratic program for Qiskit optimization"""
-        program = QuadraticProgram()
+        # Build objective function from QUBO matrix in matrix form:
+        # diagonal as linear terms, strict upper triangle as quadratic terms
+        # (coefficients handed to Qiskit as float64)
+        self._program.objective.linear = np.diag(qubo).astype(np.float64)
+        self._program.objective.quadratic = np.triu(qubo, k=1).astype(np.float64)
 
-        # Add binary variables for each asset
-        for i in range(self.n):
-            program.binary_var(name=f"x{i}")
+        return self._program
 
-        # Build objective function from QUBO matrix
-        linear = {}
-        quadratic = {}
-
-        # Linear terms (diagonal of QUBO)
-        for i in range(self.n):
-            linear[i] = qubo[i, i]
-
-        # Quadratic terms (off-diagonal of QUBO)
-        for i in range(self.n):
-            for j in range(i + 1, self.n):
-                if qubo[i, j] != 0:
-                    quadratic[(i, j)] = qubo[i, j]
+    def _warm_start_point(self, reps, gamma=0.1, beta=-np.pi / 8):
+        """
+        Trotterized-annealing initial angles: gamma ramps up and beta ramps down across layers
+        Ordered as the ansatz parameters are, all betas first and then all gammas
+        """
+        layers = np.arange(reps)
+        gammas = gamma * (layers + 1) / reps
+        betas = beta * (1 - layers / reps)
+        return np.concatenate([betas, gammas])
 
-        program.minimize(linear=linear, quadratic=quadratic)
-        
-        # Add constraint: select exactly B assets
-        program.linear_constraint(
-            linear={i: 1 for i in range(self.n)},
-            sense="==",
-            rhs=self.B,
-            name="asset_selection"
+    def _make_result(self, program, x):
+        """Wrap a selection in Qiskit's OptimizationResult, evaluated on the original program"""
+        status = (OptimizationResultStatus.SUCCESS if program.is_feasible(x)
+                  else OptimizationResultStatus.INFEASIBLE)
+        return OptimizationResult(
+            x=x, fval=program.objective.evaluate(x), variables=program.variables, status=status
         )
 
-        return program
-
-    def quantum_optimizer(self, program, max_iterations=200):
+    def quantum_optimizer(self, program, max_iterations=200, reps=2, shots=1024, aggregation=0.25):
         """Run QAOA optimization"""
+        # Budget of all assets: the constraint alone determines the portfolio
+        if self.B == self.n:
+            x_opt = np.ones(self.n)
+            return self._make_result(program, x_opt)
+
         try:
-            # Set up QAOA with more iterations using SamplerV2
+            # Penalize the budget constraint and map the QUBO onto an Ising Hamiltonian
+            converter = QuadraticProgramToQubo()
+            qubo_program = converter.convert(program)
+            hamiltonian, _ = qubo_program.to_ising()
+
+            # QUBO objective as arrays: constant + x.l + x^T Q x (Q upper triangular)
+            objective = qubo_program.objective
+            constant = objective.constant
+            linear = objective.linear.to_array()
+            quadratic = objective.quadratic.to_array(symmetric=False)
+
+            # Build and transpile the parametric ansatz once; each evaluation only binds parameters
+            ansatz = QAOAAnsatz(cost_operator=hamiltonian, reps=reps)  # 2 QAOA layers by default
+            ansatz.measure_all()
+            # The Aer simulator has no coupling map, so only basis translation is needed
+            isa_ansatz = transpile(ansatz, backend=AerSimulator(), optimization_level=0)
+
             sampler = Sampler()
-            optimizer = COBYLA(maxiter=max_iterations)
-            qaoa = QAOA(sampler=sampler, optimizer=optimizer, reps=2)  # 2 QAOA layers
 
-            solver = MinimumEigenOptimizer(qaoa)
-            result = solver.solve(program)
-        
-            return result
+            def sample(params):
+                """Sample the bound ansatz; returns decoded (K, n) solutions and their probabilities"""
+                counts = sampler.run([(isa_ansatz, params)], shots=shots).result()[0].data.meas.get_counts()
+                bitstrings = list(counts)
+                # Qubit i is variable i and sits rightmost-first in the bitstring
+                X = (np.frombuffer(''.join(bitstrings).encode(), dtype=np.uint8)
+                     .reshape(len(bitstrings), -1)[:, ::-1] - ord('0')).astype(np.float64)
+                probabilities = np.fromiter(counts.values(), dtype=np.float64, count=len(counts)) / shots
+                energies = constant + X @ linear + ((X @ quadratic) * X).sum(axis=1)
+                return X, probabilities, energies
+
+            def cost_function(params):
+                # CVaR objective: mean energy of the best `aggregation` fraction of samples
+                _, probabilities, energies = sample(params)
+                order = np.argsort(energies)
+                probabilities, energies = probabilities[order], energies[order]
+                mass_before = np.cumsum(probabilities) - probabilities
+                weights = np.clip(aggregation - mass_before, 0.0, probabilities)
+                return float(weights @ energies) / aggregation
+
+            # Classical optimization of the QAOA angles
+            # (SPSA spends 2 evaluations per iteration regardless of the number of angles)
+            if self.optimizer == "spsa":
+                optimizer = SPSA(maxiter=max_iterations, learning_rate=0.1, perturbation=0.1)
+            else:
+                optimizer = COBYLA(maxiter=max_iterations)
+            initial_point = self._warm_start_point(reps)
+            optimal = optimizer.minimize(cost_function, initial_point)
+
+            # Keep the lowest-energy bitstring sampled at the optimal angles
+            X, _, energies = sample(optimal.x)
+            x_opt = converter.interpret(X[int(np.argmin(energies))])
+
+            return self._make_result(program, x_opt)
         except Exception as e:
             raise Exception(f"Optimization failed: {str(e)}")
 
@@ -195,25 +310,18 @@ class Magnificent_7:
         x_opt = result.x
         fval = result.fval
         
+        # Binary selection vector
+        x = np.asarray(x_opt, dtype=float)
+        
         # Get selected assets
-        selected_assets = [self.tickers[i] for i in range(self.n) if x_opt[i] == 1]
+        selected_assets = np.asarray(self.tickers)[x.astype(bool)].tolist()
         
         # Calculate portfolio metrics
-        selected_indices = [i for i in range(self.n) if x_opt[i] == 1]
+        portfolio_return = float(self.mu.ravel() @ x)
         
-        if len(selected_indices) > 0:
-            portfolio_return = np.sum([self.mu[i, 0] for i in selected_indices])
-            
-            # Portfolio risk (variance)
-            portfolio_variance = 0
-            for i in selected_indices:
-                for j in selected_indices:
-                    portfolio_variance += self.sigma[i, j]
-            
-            portfolio_risk = np.sqrt(portfolio_variance)
-        else:
-            portfolio_return = 0
-            portfolio_risk = 0
+        # Portfolio risk (variance)
+        portfolio_variance = x @ self.sigma @ x
+        portfolio_risk = float(np.sqrt(portfolio_variance))
         
         return selected_assets, portfolio_return, portfolio_risk, fval
 
@@ -221,17 +329,13 @@ class Magnificent_7:
         """Run the complete optimization process"""
         print("Computing returns and statistics...")
         
-        # Compute returns and statistics
+        # Compute returns, statistics and the QUBO matrix
         returns_matrix = self.compute_returns()
-        mu = self.compute_mu(returns_matrix)
-        sigma = self.covariance_matrix(returns_matrix)
+        mu, sigma, qubo_matrix = self.classical_prep(returns_matrix)
         
         print(f"Expected returns: {mu.flatten()}")
         print(f"Risk (std dev): {np.sqrt(np.diag(sigma))}")
         
-        # Build QUBO matrix
-        qubo_matrix = self.build_qubo_matrix(mu, sigma, self.risk_aversion, self.penalty_strength, self.B)
-        
         # Create optimization program
         program = self.build_quadratic_program(qubo_matrix)
         
@@ -248,8 +352,8 @@ class Magnificent_7:
             'portfolio_return': portfolio_return,
             'portfolio_risk': portfolio_risk,
             'objective_value': objective_value,
-            'mu': mu,
-            'sigma': sigma
+            'mu': mu.copy(),  # Copies: mu and sigma are buffers reused by the next run
+            'sigma': sigma.copy()
         }
 
 